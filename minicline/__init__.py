@@ -1,5 +1,10 @@
-from .core import perform_task
-
 __version__ = "0.1.15"
 
 __all__ = ["perform_task"]
+
+def __getattr__(name):
+    # Load the core lazily so that importing minicline (e.g. for the CLI) stays cheap
+    if name == "perform_task":
+        from .core import perform_task
+        return perform_task
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
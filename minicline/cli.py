@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import click
 from pathlib import Path
-from .core import perform_task
 
 @click.group()
 def cli():
@@ -38,6 +37,9 @@ def perform_task_cmd(instructions: str | None, file: Path | None, model: str | N
     elif not instructions:
         raise click.UsageError("Either instructions argument or --file option is required")
 
+    # Imported here so that --help and shell completion don't pay for loading the core
+    from .core import perform_task
+
     perform_task(instructions, model=model, vision_model=vision_model, log_file=log_file, auto=auto, approve_all_commands=approve_all_commands, no_container=no_container, rules=rules)
 
 if __name__ == "__main__":
@@ -7,6 +7,9 @@ from time import sleep
 # Load environment variables from .env file if it exists
 load_dotenv()
 
+# Shared session so that the connection to OpenRouter is kept alive between requests
+_session = requests.Session()
+
 def run_completion(
     messages: List[Dict[str, Any]],
     *,
@@ -71,7 +74,7 @@ def run_completion(
         print(f"Num. messages in conversation: {len(conversation_messages)}")
 
         print("Submitting completion request...")
-        response = requests.post(url, headers=headers, json=payload)
+        response = _session.post(url, headers=headers, json=payload)
         if response.status_code != 200:
             raise RuntimeError(f"OpenRouter API request failed: {response.text}")
 
@@ -80,13 +83,20 @@ def run_completion(
         get_url = f"https://openrouter.ai/api/v1/generation/?id={completion['id']}"
         sleep(0.5)
         for retry in range(3):
-            response2 = requests.get(
+            response2 = _session.get(
                 get_url,
                 headers={"Authorization": f"Bearer {api_key}"})
             response2_json = response2.json()
-            if "error" in response2_json:
+            if "error" not in response2_json:
+                break
+            if retry < 2:
                 sleep(1)
-        total_cost += response2_json["data"]["total_cost"]
+        # If the generation stats are still unavailable, don't fail the completion over the cost
+        generation_data = response2_json.get("data") or {}
+        if "total_cost" in generation_data:
+            total_cost += generation_data["total_cost"]
+        else:
+            print(f"Warning: cost of generation {completion['id']} is unavailable and is not included in the total cost")
         prompt_tokens = completion["usage"]["prompt_tokens"]
         completion_tokens = completion["usage"]["completion_tokens"]
 
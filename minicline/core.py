@@ -1,48 +1,57 @@
 from __future__ import annotations
 
+import ast
+import functools
+import itertools
 import re
 import sys
+from collections import deque
 from typing import List, Dict, Any, Optional, Tuple, Union
 from pathlib import Path
 from dataclasses import dataclass
 
 from .completion.run_completion import run_completion
-from .tools.read_file import read_file
-from .tools.read_image import read_image
-from .tools.search_files import search_files
-from .tools.execute_command import execute_command
-from .tools.execute_script import execute_script
-from .tools.list_files import list_files
-from .tools.ask_followup_question import ask_followup_question
-from .tools.write_to_file import write_to_file
-from .tools.replace_in_file import replace_in_file
-from .tools.attempt_completion import attempt_completion
 import os
 
-def read_system_prompt(*, cwd: str | None, auto: bool = False, rules_file: Path | None = None) -> str:
-    """Read and process the system prompt template."""
+# Directories that are never descended into when listing the working directory
+_EXCLUDED_DIR_NAMES = {'node_modules', '.git', '.venv', '__pycache__'}
+
+# Maximum number of files listed in environment_details
+_MAX_NUM_ENV_FILES = 25
+
+@dataclass
+class WorkingDirectoryFiles:
+    files: List[str]  # sorted, relative to cwd
+    truncated: bool  # whether files were left out because of _MAX_NUM_ENV_FILES
+
+# Cache of the files listed in environment_details, keyed by cwd. Each entry holds the
+# listing and the modification times of the directories that were scanned to find it.
+_working_directory_files_cache: Dict[str, Tuple[WorkingDirectoryFiles, Dict[str, int]]] = {}
+
+# Patterns used to process the conditional sections of the system prompt template
+_NOT_AUTO_SECTION_RE = re.compile(r'=== begin if not auto ===\n.*?=== end if not auto ===\n', re.DOTALL)
+_NOT_AUTO_MARKER_RE = re.compile(r'=== (begin|end) if not auto ===\n')
+
+@functools.lru_cache(maxsize=1)
+def _load_system_prompt_template() -> str:
+    """Read the system prompt template (cached, since it doesn't change while running)."""
     template_path = Path(__file__).parent / "templates" / "system_prompt.txt"
     with open(template_path, "r") as f:
-        content = f.read()
+        return f.read()
+
+def read_system_prompt(*, cwd: str | None, auto: bool = False, rules_file: Path | None = None) -> str:
+    """Read and process the system prompt template."""
+    content = _load_system_prompt_template()
 
     if cwd:
         content = content.replace("{{ cwd }}", cwd)
 
     # In auto mode, remove sections and their markers
     if auto:
-        content = re.sub(
-            r'=== begin if not auto ===\n.*?=== end if not auto ===\n',
-            '',
-            content,
-            flags=re.DOTALL
-        )
+        content = _NOT_AUTO_SECTION_RE.sub('', content)
     else:
         # Otherwise just remove the markers
-        content = re.sub(
-            r'=== (begin|end) if not auto ===\n',
-            '',
-            content
-        )
+        content = _NOT_AUTO_MARKER_RE.sub('', content)
 
     # Add additional rules if provided
     if rules_file:
@@ -51,6 +60,33 @@ def read_system_prompt(*, cwd: str | None, auto: bool = False, rules_file: Path
 
     return content
 
+def _find_element(content: str, start: int = 0) -> Optional[Tuple[str, str, int]]:
+    """Find the first <name>...</name> element in content at or after start.
+
+    This matches the same elements as searching for the regex <(\\w+)>(.*?)</\\1>, but
+    scans with str.find so that long messages are processed without regex backtracking.
+
+    Returns:
+        Tuple of (name, inner_content, end_index) or None if no element was found
+    """
+    # Names for which no closing tag exists after a certain point (so never later either)
+    unclosed_names = set()
+    i = content.find('<', start)
+    while i != -1:
+        j = i + 1
+        while j < len(content) and (content[j].isalnum() or content[j] == '_'):
+            j += 1
+        if j > i + 1 and j < len(content) and content[j] == '>':
+            name = content[i + 1:j]
+            if name not in unclosed_names:
+                closing_tag = f"</{name}>"
+                k = content.find(closing_tag, j + 1)
+                if k != -1:
+                    return name, content[j + 1:k], k + len(closing_tag)
+                unclosed_names.add(name)
+        i = content.find('<', i + 1)
+    return None
+
 def parse_tool_use_call(content: str) -> Tuple[Optional[str], Union[str, None], Dict[str, Any]]:
     """Parse a tool use from the assistant's message.
 
@@ -62,48 +98,58 @@ def parse_tool_use_call(content: str) -> Tuple[Optional[str], Union[str, None],
         thinking_content may be None if no thinking tags present
     """
     # First try to extract thinking content
-    thinking_pattern = r"<thinking>(.*?)</thinking>"
-    thinking_match = re.search(thinking_pattern, content, re.DOTALL)
-    thinking_content = thinking_match.group(1).strip() if thinking_match else None
+    thinking_content = None
+    remaining_content = content
+    thinking_start = content.find("<thinking>")
+    if thinking_start != -1:
+        thinking_end = content.find("</thinking>", thinking_start + len("<thinking>"))
+        if thinking_end != -1:
+            thinking_content = content[thinking_start + len("<thinking>"):thinking_end].strip()
+            remaining_content = content[thinking_end + len("</thinking>"):]
 
     # Basic XML parsing for tool use - could be improved with proper XML parser
-    pattern = r"<(\w+)>(.*?)</\1>"
-    remaining_content = content[thinking_match.end():] if thinking_match else content
-    tool_match = re.search(pattern, remaining_content, re.DOTALL)
-    if not tool_match:
+    tool_element = _find_element(remaining_content)
+    if not tool_element:
         return thinking_content, None, {}
 
-    tool_name = tool_match.group(1)
-    tool_content = tool_match.group(2)
+    tool_name, tool_content, _ = tool_element
 
     # Parse parameters
     params = {}
-    param_matches = re.finditer(r"<(\w+)>(.*?)</\1>", tool_content, re.DOTALL)
-    for match in param_matches:
-        param_name = match.group(1)
-        param_value = match.group(2).strip()
+    param_element = _find_element(tool_content)
+    while param_element:
+        param_name, param_value, end = param_element
+        param_value = param_value.strip()
         if param_name == "options": # Handle array parameter
             try:
-                param_value = eval(param_value)  # Convert string array to actual array
-            except:
+                param_value = ast.literal_eval(param_value)  # Convert string array to actual array
+            except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                param_value = []
+            if isinstance(param_value, (tuple, set, frozenset)):
+                param_value = list(param_value)
+            elif not isinstance(param_value, list):
                 param_value = []
         params[param_name] = param_value
+        param_element = _find_element(tool_content, end)
     return thinking_content, tool_name, params
 
 def execute_tool(tool_name: str, params: Dict[str, Any], cwd: str, auto: bool, approve_all_commands: bool, vision_model: str, no_container: bool) -> Tuple[str, str, Union[str, None], bool, int, int]:
     """Execute a tool and return a tuple of (tool_call_summary, result_text)."""
 
     try:
-        # Tool implementations
+        # Tool implementations (imported as needed so that unused tools are never loaded)
         if tool_name == "read_file":
+            from .tools.read_file import read_file
             summary, text = read_file(params['path'], cwd=cwd)
             return summary, text, None, True, 0, 0
 
         if tool_name == "read_image":
+            from .tools.read_image import read_image
             summary, text, image_data_url, pt, ct = read_image(params['path'], vision_model=vision_model, instructions=params.get('instructions', None), cwd=cwd)
             return summary, text, image_data_url, True, pt, ct
 
         elif tool_name == "write_to_file":
+            from .tools.write_to_file import write_to_file
             summary, text = write_to_file(
                 params['path'],
                 params['content'],
@@ -113,6 +159,7 @@ def execute_tool(tool_name: str, params: Dict[str, Any], cwd: str, auto: bool, a
             return summary, text, None, True, 0, 0
 
         elif tool_name == "replace_in_file":
+            from .tools.replace_in_file import replace_in_file
             summary, text = replace_in_file(
                 params['path'],
                 params['diff'],
@@ -122,6 +169,7 @@ def execute_tool(tool_name: str, params: Dict[str, Any], cwd: str, auto: bool, a
             return summary, text, None, True, 0, 0
 
         elif tool_name == "search_files":
+            from .tools.search_files import search_files
             summary, text = search_files(
                 params['path'],
                 params['regex'],
@@ -131,6 +179,7 @@ def execute_tool(tool_name: str, params: Dict[str, Any], cwd: str, auto: bool, a
             return summary, text, None, True, 0, 0
 
         elif tool_name == "execute_command":
+            from .tools.execute_command import execute_command
             timeout = int(params.get('timeout', 60))  # Default to 60 seconds if not provided
             summary, text = execute_command(
                 params['command'],
@@ -144,6 +193,7 @@ def execute_tool(tool_name: str, params: Dict[str, Any], cwd: str, auto: bool, a
             return summary, text, None, True, 0, 0
 
         elif tool_name == "execute_script":
+            from .tools.execute_script import execute_script
             summary, text = execute_script(
                 params['script'],
                 params['language'],
@@ -156,6 +206,7 @@ def execute_tool(tool_name: str, params: Dict[str, Any], cwd: str, auto: bool, a
             return summary, text, None, True, 0, 0
 
         elif tool_name == "list_files":
+            from .tools.list_files import list_files
             summary, text = list_files(
                 params['path'],
                 params.get('recursive', False),
@@ -168,6 +219,7 @@ def execute_tool(tool_name: str, params: Dict[str, Any], cwd: str, auto: bool, a
                 # even though the system message doesn't provide this option, it's possible
                 # that the AI knows about it anyway. So, let's just reply as appropriate
                 return "ask_followup_question", "The user is not able to answer questions because we are in auto mode", None, False, 0, 0
+            from .tools.ask_followup_question import ask_followup_question
             summary, text = ask_followup_question(
                 params['question'],
                 params.get('options')
@@ -175,6 +227,7 @@ def execute_tool(tool_name: str, params: Dict[str, Any], cwd: str, auto: bool, a
             return summary, text, None, True, 0, 0
 
         elif tool_name == "attempt_completion":
+            from .tools.attempt_completion import attempt_completion
             summary, text = attempt_completion(
                 params['result'],
                 auto=auto
@@ -190,6 +243,12 @@ def execute_tool(tool_name: str, params: Dict[str, Any], cwd: str, auto: bool, a
         text = f"ERROR: {str(e)}"
         return summary, text, None, False, 0, 0
 
+def _write_output(text: str) -> None:
+    """Write text to stdout (which may be a TeeOutput) in one call and flush it."""
+    if text:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
 class TeeOutput:
     """Class that duplicates output to both console and log file."""
     def __init__(self, log_file_handle):
@@ -249,11 +308,11 @@ def perform_task(instructions: str, *, cwd: str | None = None, model: str | None
     ]
 
     # Add initial user message with task instructions
-    base_env = get_base_env(cwd=cwd)
+    listing = get_working_directory_files(cwd=cwd)
+    base_env = get_base_env(cwd=cwd, listing=listing)
     user_message = f"<task>\n{instructions}\n</task>\n\n{base_env}"
     messages.append({"role": "user", "content": [
-        {'type': 'text', 'text': user_message},
-        {'type': 'text', 'text': base_env}
+        {'type': 'text', 'text': user_message}
     ]})
 
     total_prompt_tokens = 0
@@ -297,12 +356,11 @@ def perform_task(instructions: str, *, cwd: str | None = None, model: str | None
                 messages.append({"role": "system", "content": "No tool use found. Please provide a tool use in the following format: <thinking>...</thinking><tool_name><param1>value1</param1><param2>value2</param2></tool_name>"})
                 continue
 
-            if thinking_content:
-                print(thinking_content)
-
+            # Status output is collected and written at once, rather than with many print calls
+            status = f"{thinking_content}\n" if thinking_content else ""
             if tool_name not in ["attempt_completion", "execute_command", "execute_script", "write_to_file", "replace_in_file"]:
-                print(f"\nTool: {tool_name}")
-                print(f"Params: {params}")
+                status += f"\nTool: {tool_name}\nParams: {params}\n"
+            _write_output(status)
 
             tool_call_summary, tool_result_text, image_data_url, handled, additional_vision_prompt_tokens, additional_vision_completion_tokens = execute_tool(tool_name, params, cwd, auto=auto, approve_all_commands=approve_all_commands, vision_model=vision_model, no_container=no_container)
             total_vision_prompt_tokens += additional_vision_prompt_tokens
@@ -314,24 +372,31 @@ def perform_task(instructions: str, *, cwd: str | None = None, model: str | None
             else:
                 num_consecutive_failures = 0
 
-            print(f"Total prompt tokens: {total_prompt_tokens} + {total_vision_prompt_tokens}")
-            print(f"Total completion tokens: {total_completion_tokens} + {total_vision_completion_tokens}")
-            print(f"Total cost: {total_cost}")
-            print("")
+            status = (
+                f"Total prompt tokens: {total_prompt_tokens} + {total_vision_prompt_tokens}\n"
+                f"Total completion tokens: {total_completion_tokens} + {total_vision_completion_tokens}\n"
+                f"Total cost: {total_cost}\n\n"
+            )
 
             if tool_result_text == "TASK_COMPLETE":
+                _write_output(status)
                 if log_file_handle:
                     log_file_handle.close()
                 break
 
             # Print the result of the tool
-            print("=========================================")
-            print(f"\n{tool_call_summary}:")
-            print(tool_result_text)
-            print("=========================================")
-            print("")
+            status += (
+                "=========================================\n"
+                f"\n{tool_call_summary}:\n"
+                f"{tool_result_text}\n"
+                "=========================================\n\n"
+            )
+            _write_output(status)
 
-            base_env = get_base_env(cwd=cwd)
+            # After the first message, only send the changes to the file listing
+            previous_listing = listing
+            listing = get_working_directory_files(cwd=cwd)
+            base_env = get_env_delta(cwd=cwd, listing=listing, previous_listing=previous_listing)
             content: List[Dict[str, Any]] = [
                 {'type': 'text', 'text': f"[{tool_call_summary}] Result:"},
                 {'type': 'text', 'text': tool_result_text},
@@ -359,59 +424,99 @@ def perform_task(instructions: str, *, cwd: str | None = None, model: str | None
         total_cost=total_cost
     )
 
-def get_base_env(*, cwd: str) -> str:
+def get_working_directory_files(*, cwd: str) -> WorkingDirectoryFiles:
+    """Get the files (relative to cwd) to include in environment_details."""
+    # If none of the scanned directories have changed, the listing is the same as last time
+    cached = _working_directory_files_cache.get(cwd)
+    if cached is not None:
+        cached_listing, dir_mtimes = cached
+        if _dir_mtimes_unchanged(dir_mtimes):
+            return WorkingDirectoryFiles(files=list(cached_listing.files), truncated=cached_listing.truncated)
+
     # Get list of files using breadth-first search, limited to certain number of files
-    max_num_files = 25
+    max_num_files = _MAX_NUM_ENV_FILES
     files = []
-    dirs_to_process = [Path(cwd)]
-    processed_dirs = set()
-
-    while dirs_to_process and len(files) < max_num_files:
-        current_dir = dirs_to_process.pop(0)
-
-        # never process node_modules
-        if 'node_modules' in str(current_dir):
-            continue
-
-        # never process .git
-        if '.git' in str(current_dir):
-            continue
-
-        # never process .venv
-        if '.venv' in str(current_dir):
-            continue
-
-        # never process __pycache__
-        if '__pycache__' in str(current_dir):
-            continue
+    # Once the limit is reached, the search only continues until one more file is found
+    truncated = False
+    dir_mtimes = {}
+    dirs_to_process = deque([cwd])
 
-        if current_dir in processed_dirs:
-            continue
-
-        processed_dirs.add(current_dir)
+    while dirs_to_process and not truncated:
+        current_dir = dirs_to_process.popleft()
 
         try:
-            # First add files in current directory
-            for path in current_dir.iterdir():
-                if len(files) >= max_num_files:
-                    break
-
-                if path.is_file():
-                    # Get relative path from cwd
-                    rel_path = str(path.relative_to(cwd))
-                    files.append(rel_path)
-                elif path.is_dir():
-                    dirs_to_process.append(path)
-        except PermissionError:
+            # Record the modification time before listing, so that changes made while listing invalidate the cache
+            dir_mtimes[current_dir] = os.stat(current_dir).st_mtime_ns
+            # DirEntry caches the file type from the directory listing, so no extra stat per entry
+            with os.scandir(current_dir) as it:
+                for entry in it:
+                    if entry.is_file():
+                        if len(files) >= max_num_files:
+                            truncated = True
+                            break
+                        # Get relative path from cwd
+                        files.append(os.path.relpath(entry.path, cwd))
+                    elif entry.is_dir(follow_symlinks=False):
+                        # never process node_modules, .git, .venv or __pycache__
+                        if entry.name not in _EXCLUDED_DIR_NAMES:
+                            dirs_to_process.append(entry.path)
+        except OSError:
             continue  # Skip directories we can't access
 
-    # Sort files for consistent output
-    files.sort()
-    files_str = '\n'.join(files)
+    # Sort files for consistent output, keeping the files of each directory together
+    files.sort(key=lambda f: (os.path.dirname(f), f))
+    _working_directory_files_cache[cwd] = (WorkingDirectoryFiles(files=files, truncated=truncated), dir_mtimes)
+    return WorkingDirectoryFiles(files=list(files), truncated=truncated)
+
+def _dir_mtimes_unchanged(dir_mtimes: Dict[str, int]) -> bool:
+    try:
+        return all(os.stat(d).st_mtime_ns == mtime for d, mtime in dir_mtimes.items())
+    except OSError:
+        return False
+
+def _format_file_tree(files: List[str]) -> str:
+    """Format a list of files (sorted by directory) with one header per directory."""
+    lines = []
+    for directory, group in itertools.groupby(files, key=os.path.dirname):
+        if directory:
+            lines.append(f"{directory}/")
+            lines.extend(f"  {os.path.basename(f)}" for f in group)
+        else:
+            lines.extend(group)
+    return '\n'.join(lines)
+
+def get_base_env(*, cwd: str, listing: WorkingDirectoryFiles | None = None) -> str:
+    if listing is None:
+        listing = get_working_directory_files(cwd=cwd)
+    files_str = _format_file_tree(listing.files)
+    if listing.truncated:
+        files_str += f"\n(listing limited to {_MAX_NUM_ENV_FILES} files, use list_files to see more)"
 
     base_env = f"<environment_details>\nCurrent Working Directory: {cwd}\n\n# Working Directory Files (Recursive)\n{files_str}\n</environment_details>"
     return base_env
 
+def get_env_delta(*, cwd: str, listing: WorkingDirectoryFiles, previous_listing: WorkingDirectoryFiles) -> str:
+    """Like get_base_env, but only lists the files added or removed since previous_listing."""
+    if listing.truncated or previous_listing.truncated:
+        # A limited listing can gain or lose files that were not actually added or removed
+        # (they just moved in or out of the limit), so send the full listing if it changed
+        if listing.files != previous_listing.files:
+            return get_base_env(cwd=cwd, listing=listing)
+        added = []
+        removed = []
+    else:
+        current = set(listing.files)
+        previous = set(previous_listing.files)
+        added = [f for f in listing.files if f not in previous]
+        removed = [f for f in previous_listing.files if f not in current]
+    if added or removed:
+        changes_str = '\n'.join([f"+ {f}" for f in added] + [f"- {f}" for f in removed])
+    else:
+        changes_str = "(no changes)"
+
+    env_delta = f"<environment_details>\nCurrent Working Directory: {cwd}\n\n# Working Directory Files (Changes Since Previous Message)\n{changes_str}\n</environment_details>"
+    return env_delta
+
 
 def run_completion_with_retries(
         messages: List[Dict[str, Any]], *,
@@ -1,11 +1,141 @@
 """Tool for executing system commands."""
 
+import codecs
+import hashlib
 import os
 import select
+import shlex
+import shutil
 import signal
 import subprocess
 import time
-from typing import Tuple
+from collections import deque
+from typing import List, Optional, Tuple
+
+# Maximum number of output chunks (of up to 4096 bytes each) retained per stream for the tool result
+_MAX_OUTPUT_CHUNKS = 256
+
+class _OutputBuffer:
+    """Accumulates the output of a stream, keeping only the most recent chunks."""
+    def __init__(self, max_chunks: int = _MAX_OUTPUT_CHUNKS):
+        # Incremental decoding so multi-byte characters split across reads are not garbled
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._chunks: deque = deque(maxlen=max_chunks)
+        self._truncated = False
+
+    def feed(self, data: bytes, final: bool = False) -> str:
+        """Add raw output and return the newly decoded text."""
+        text = self._decoder.decode(data, final=final)
+        if text:
+            if len(self._chunks) == self._chunks.maxlen:
+                self._truncated = True
+            self._chunks.append(text)
+        return text
+
+    def __bool__(self) -> bool:
+        return len(self._chunks) > 0
+
+    def __str__(self) -> str:
+        text = "".join(self._chunks)
+        if self._truncated:
+            text = "[... earlier output truncated ...]\n" + text
+        return text
+
+# Characters that only have their meaning when the command is run by a shell
+_SHELL_METACHARACTERS = set('|&;<>()$`\\*?[]{}~#!\n')
+# Shell builtins that can't be run as executables
+_SHELL_BUILTINS = {'.', 'alias', 'cd', 'command', 'eval', 'exec', 'exit', 'export', 'read', 'readonly', 'return', 'set', 'shift', 'source', 'trap', 'type', 'ulimit', 'umask', 'unalias', 'unset', 'wait'}
+
+def _split_simple_command(command: str) -> Optional[List[str]]:
+    """Split a command into arguments if it can be run directly, without a shell.
+
+    Returns:
+        The list of arguments, or None if the command needs a shell
+    """
+    if any(c in _SHELL_METACHARACTERS for c in command):
+        return None
+    try:
+        args = shlex.split(command)
+    except ValueError:
+        return None
+    if not args:
+        return None
+    program = args[0]
+    # Variable assignments and builtins need a shell, and relative paths are resolved by the shell
+    # from cwd (and if the program can't be found, the shell reports it in the usual way)
+    if '=' in program or '/' in program or program in _SHELL_BUILTINS or shutil.which(program) is None:
+        return None
+    return args
+
+# Docker images that have already been pulled by this process
+_pulled_docker_images = set()
+
+def _ensure_docker_image(docker_image: str) -> None:
+    """Pull the docker image, unless it was already pulled by this process."""
+    if docker_image in _pulled_docker_images:
+        return
+    print(f"Pulling docker image: {docker_image}")
+    subprocess.run(["docker", "pull", docker_image], check=True)
+    _pulled_docker_images.add(docker_image)
+
+# Persistent containers that this process has already found or started running
+_running_persistent_containers = set()
+
+def _ensure_persistent_container(docker_image: str, cwd: str) -> str:
+    """Make sure a long-lived container for this image and working directory is running.
+
+    The container is kept alive (independently of this process) so that subsequent
+    commands can be run in it with docker exec rather than starting a new container
+    each time.
+
+    Returns:
+        The name of the container
+    """
+    key = hashlib.sha1(f"{docker_image}:{cwd}".encode()).hexdigest()[:12]
+    container_name = f"minicline_persistent_{key}"
+    if container_name in _running_persistent_containers:
+        return container_name
+
+    # A single docker call tells us whether the container is running, stopped or missing
+    result = subprocess.run(
+        ["docker", "ps", "-a", "--filter", f"name=^{container_name}$", "--format", "{{.State}}"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    state = result.stdout.strip()
+    if state == "running":
+        _running_persistent_containers.add(container_name)
+        return container_name
+    if state == "paused":
+        print(f"Unpausing existing container: {container_name}")
+        subprocess.run(["docker", "unpause", container_name], check=True, capture_output=True)
+        _running_persistent_containers.add(container_name)
+        return container_name
+    if state in ("created", "exited"):
+        print(f"Starting existing container: {container_name}")
+        subprocess.run(["docker", "start", container_name], check=True, capture_output=True)
+        _running_persistent_containers.add(container_name)
+        return container_name
+    if state:
+        # The container can't be started again (e.g. dead or being removed), so replace it
+        print(f"Removing unusable container ({state}): {container_name}")
+        subprocess.run(["docker", "rm", "-f", container_name], check=False, capture_output=True)
+
+    _ensure_docker_image(docker_image)
+    print(f"Creating persistent container: {container_name}")
+    subprocess.run([
+        "docker", "run",
+        "-d",  # Run in the background
+        "--init",  # Reap the processes started by docker exec
+        "--name", container_name,
+        "-v", f"{cwd}:{cwd}",  # Mount current directory
+        "-w", cwd,  # Set working directory
+        docker_image,
+        "tail", "-f", "/dev/null"
+    ], check=True, capture_output=True)
+    _running_persistent_containers.add(container_name)
+    return container_name
 
 def execute_command(command: str, requires_approval: bool, *, cwd: str, auto: bool, approve_all_commands: bool, timeout: int = 60, no_container: bool) -> Tuple[str, str]:
     """Execute a system command.
@@ -29,6 +159,7 @@ def execute_command(command: str, requires_approval: bool, *, cwd: str, auto: bo
     else:
         docker_image = None
     use_apptainer = os.getenv("MINICLINE_USE_APPTAINER", "false").lower() == "true"
+    use_persistent_container = os.getenv("MINICLINE_DOCKER_PERSISTENT_CONTAINER", "false").lower() == "true"
 
     tool_call_summary = f"execute_command '{command}'"
     if requires_approval:
@@ -62,8 +193,8 @@ def execute_command(command: str, requires_approval: bool, *, cwd: str, auto: bo
     try:
         # Run command and capture output
         process = None
-        stdout = ""
-        stderr = ""
+        stdout = _OutputBuffer()
+        stderr = _OutputBuffer()
         use_docker = docker_image is not None
         container_name = None
         try:
@@ -80,10 +211,21 @@ def execute_command(command: str, requires_approval: bool, *, cwd: str, auto: bo
                     shell = False
                     full_command = apptainer_cmd
                     container_name = None
+                elif use_persistent_container:
+                    # Run the command in the long-lived container for this image and cwd
+                    container_name = _ensure_persistent_container(docker_image, cwd)
+                    docker_cmd = [
+                        "docker", "exec",
+                        "-w", cwd,  # Set working directory
+                        "-t",  # Allocate a pseudo-TTY
+                        container_name,
+                        "/bin/sh", "-c", command
+                    ]
+                    shell = False
+                    full_command = docker_cmd
                 else:
-                    # Pull the docker image first
-                    print(f"Pulling docker image: {docker_image}")
-                    subprocess.run(["docker", "pull", docker_image], check=True)
+                    # Pull the docker image first (only once per process)
+                    _ensure_docker_image(docker_image)
 
                     # Generate a unique container name
                     container_name = f"minicline_sandbox_{int(time.time())}"
@@ -101,16 +243,21 @@ def execute_command(command: str, requires_approval: bool, *, cwd: str, auto: bo
                     shell = False
                     full_command = docker_cmd
             else:
-                # If not using docker, run the command directly
-                shell = True
-                full_command = command
+                # If not using docker, run the command directly, without an intermediate
+                # shell process unless the command uses shell syntax
+                args = _split_simple_command(command)
+                if args is not None:
+                    shell = False
+                    full_command = args
+                else:
+                    shell = True
+                    full_command = command
 
             # Start process in its own process group so we can kill it and its children
             process = subprocess.Popen(
                 full_command,
                 shell=shell,
                 cwd=cwd,
-                text=True,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 preexec_fn=os.setsid  # Create new process group
@@ -135,6 +282,11 @@ def execute_command(command: str, requires_approval: bool, *, cwd: str, auto: bo
                     time.sleep(0.1)  # Give process time to terminate
                     if process.poll() is None:  # If still running
                         os.killpg(os.getpgid(process.pid), signal.SIGKILL)  # Force kill
+                    if use_docker and use_persistent_container and container_name is not None:
+                        # Killing docker exec does not stop the command inside the container, so kill
+                        # the container (it is started again for the next command)
+                        subprocess.run(["docker", "kill", container_name], check=False, capture_output=True)
+                        _running_persistent_containers.discard(container_name)
                     # Format timeout output including captured stdout/stderr
                     output_parts = [f"Command timed out after {timeout} seconds and was forcefully terminated"]
                     if stdout:
@@ -150,21 +302,20 @@ def execute_command(command: str, requires_approval: bool, *, cwd: str, auto: bo
                         if process.stdout and fd == process.stdout.fileno():
                             chunk = os.read(fd, 4096)  # Read raw bytes
                             if chunk:
-                                output = chunk.decode()
-                                stdout += output
-                                print(output, end="", flush=True)
+                                print(stdout.feed(chunk), end="", flush=True)
                         if process.stderr and fd == process.stderr.fileno():
                             chunk = os.read(fd, 4096)  # Read raw bytes
                             if chunk:
-                                output = chunk.decode()
-                                stderr += output
-                                print(output, end="", flush=True)
+                                print(stderr.feed(chunk), end="", flush=True)
 
             # Get final output and return code
             final_stdout, final_stderr = process.communicate()
-            stdout += final_stdout
-            stderr += final_stderr
+            print(stdout.feed(final_stdout, final=True), end="")
+            print(stderr.feed(final_stderr, final=True), end="", flush=True)
             returncode = process.returncode
+            if use_docker and use_persistent_container and returncode != 0:
+                # The failure may be because the container was stopped, so check it again next time
+                _running_persistent_containers.discard(container_name)
 
         except Exception as e:
             if process and process.poll() is None:
@@ -172,6 +323,7 @@ def execute_command(command: str, requires_approval: bool, *, cwd: str, auto: bo
                     # If using docker and we have a container name, stop it first
                     if use_docker and not use_apptainer and container_name is not None:
                         subprocess.run(["docker", "stop", str(container_name)], check=False, capture_output=True)
+                        _running_persistent_containers.discard(container_name)
                     time.sleep(0.1)
                     # Then kill the process group
                     os.killpg(os.getpgid(process.pid), signal.SIGTERM)
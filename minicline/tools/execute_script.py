@@ -35,15 +35,23 @@ def execute_script(script: str, language: str, requires_approval: bool, *, cwd:
     print(script)
     print("================================")
 
-    # Create temporary script file
-    script_path = "_minicline_tmp_script.py"
+    # Create temporary script file. It has to be within cwd because that is the only
+    # directory mounted in the container, and it keeps the script's directory (and
+    # therefore its imports) the same as cwd. A unique name avoids clashes between
+    # scripts that run concurrently.
+    script_path = None
     try:
-        # Write script to temporary file
-        with open(os.path.join(cwd, script_path), "w") as f:
+        with tempfile.NamedTemporaryFile("w", suffix=".py", prefix="_minicline_tmp_script_", dir=cwd, delete=False) as f:
+            # Record the path first so the file is cleaned up even if writing fails
+            script_path = f.name
             f.write(script)
 
+        # NamedTemporaryFile creates the file readable only by its owner, but the container
+        # may run as a different user, so make it readable like a normally written file
+        os.chmod(script_path, 0o644)
+
         # Execute the script using execute_command
-        command = f"python {script_path}"
+        command = f"python {os.path.basename(script_path)}"
         _, result = execute_command(
             command=command,
             requires_approval=requires_approval,
@@ -55,9 +63,10 @@ def execute_script(script: str, language: str, requires_approval: bool, *, cwd:
 
     finally:
         # Clean up temporary script file
-        try:
-            os.remove(os.path.join(cwd, script_path))
-        except:
-            pass  # Ignore cleanup errors
+        if script_path is not None:
+            try:
+                os.remove(script_path)
+            except OSError:
+                pass  # Ignore cleanup errors
 
     return tool_call_summary, result
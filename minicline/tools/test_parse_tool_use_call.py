@@ -0,0 +1,82 @@
+"""Tests for parse_tool_use_call. Run with pytest or: python -m minicline.tools.test_parse_tool_use_call"""
+
+import random
+import re
+from minicline.core import parse_tool_use_call
+
+def parse_with_regex(content: str):
+    """Reference implementation: the regex-based parser that parse_tool_use_call replaced"""
+    thinking_match = re.search(r"<thinking>(.*?)</thinking>", content, re.DOTALL)
+    thinking_content = thinking_match.group(1).strip() if thinking_match else None
+    remaining_content = content[thinking_match.end():] if thinking_match else content
+    tool_match = re.search(r"<(\w+)>(.*?)</\1>", remaining_content, re.DOTALL)
+    if not tool_match:
+        return thinking_content, None, {}
+    params = {}
+    for match in re.finditer(r"<(\w+)>(.*?)</\1>", tool_match.group(2), re.DOTALL):
+        params[match.group(1)] = match.group(2).strip()
+    return thinking_content, tool_match.group(1), params
+
+def check(name: str, content: str, expected):
+    print(f"\n=== Test: {name} ===")
+    result = parse_tool_use_call(content)
+    assert result == expected, f"Expected {expected}, got {result}"
+    assert result == parse_with_regex(content), f"Result differs from regex parser: {parse_with_regex(content)}"
+    print("Test passed!")
+
+def test_thinking_and_tool():
+    check(
+        "Thinking and tool",
+        "<thinking>\nRead the file first\n</thinking>\n<read_file>\n<path>src/main.py</path>\n</read_file>",
+        ("Read the file first", "read_file", {"path": "src/main.py"})
+    )
+
+def test_unclosed_tag_before_valid_tag():
+    check(
+        "Unclosed tag followed by a valid one",
+        "Let me check <this and <note> that\n<list_files><path>.</path><recursive>true</recursive></list_files>",
+        (None, "list_files", {"path": ".", "recursive": "true"})
+    )
+
+def test_repeated_param():
+    check(
+        "Repeated param (last one wins)",
+        "<write_to_file><path>a.txt</path><path>b.txt</path><content>x</content></write_to_file>",
+        (None, "write_to_file", {"path": "b.txt", "content": "x"})
+    )
+
+def test_name_with_underscores_and_digits():
+    check(
+        "Name with underscores and digits",
+        "<tool_2><param_1>value</param_1><p2>other</p2></tool_2>",
+        (None, "tool_2", {"param_1": "value", "p2": "other"})
+    )
+
+def test_no_tool():
+    check(
+        "No tool use",
+        "<thinking>nothing to do</thinking> just text with a < and a >",
+        ("nothing to do", None, {})
+    )
+
+def test_matches_regex_parser_on_random_input():
+    print("\n=== Test: Random input matches regex parser ===")
+    tokens = ["<thinking>", "</thinking>", "<a>", "</a>", "<b_1>", "</b_1>", "<path>", "</path>",
+              "<", ">", "</", "x", " ", "\n", "<a >", "<>"]
+    rng = random.Random(0)
+    for _ in range(20000):
+        content = "".join(rng.choice(tokens) for _ in range(rng.randint(0, 14)))
+        assert parse_tool_use_call(content) == parse_with_regex(content), f"Mismatch for {content!r}"
+    print("Test passed!")
+
+def main():
+    test_thinking_and_tool()
+    test_unclosed_tag_before_valid_tag()
+    test_repeated_param()
+    test_name_with_underscores_and_digits()
+    test_no_tool()
+    test_matches_regex_parser_on_random_input()
+    print("\nAll tests completed successfully!")
+
+if __name__ == "__main__":
+    main()